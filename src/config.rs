@@ -83,6 +83,17 @@ fn get_branches_tracks_remote_heads(repo: &Repository, config: &GitConfig) -> Re
     let mut local_bases = Vec::new();
     let mut all_bases = Vec::new();
 
+    // Resolve upstreams once rather than once per remote HEAD.
+    let mut upstreams = Vec::new();
+    for branch in repo.branches(Some(BranchType::Local))? {
+        let (branch, _) = branch?;
+        let branch = LocalBranch::try_from(&branch)?;
+
+        if let RemoteTrackingBranchStatus::Exists(upstream) = branch.fetch_upstream(repo, config)? {
+            upstreams.push((branch, upstream));
+        }
+    }
+
     for reference in repo.references_glob("refs/remotes/*/HEAD")? {
         let reference = reference?;
         // git symbolic-ref refs/remotes/*/HEAD
@@ -99,16 +110,9 @@ fn get_branches_tracks_remote_heads(repo: &Repository, config: &GitConfig) -> Re
         let refname = resolved.name().context("non utf-8 reference name")?;
         all_bases.push(refname.to_owned());
 
-        for branch in repo.branches(Some(BranchType::Local))? {
-            let (branch, _) = branch?;
-            let branch = LocalBranch::try_from(&branch)?;
-
-            if let RemoteTrackingBranchStatus::Exists(upstream) =
-                branch.fetch_upstream(repo, config)?
-            {
-                if upstream.refname == refname {
-                    local_bases.push(branch.short_name().to_owned());
-                }
+        for (branch, upstream) in &upstreams {
+            if upstream.refname == refname {
+                local_bases.push(branch.short_name().to_owned());
             }
         }
     }
@@ -310,11 +314,15 @@ impl ConfigValues for bool {
 
 impl ConfigValues for u64 {
     fn get_config_value(config: &GitConfig, key: &str) -> Result<Self, git2::Error> {
+        // libgit2 already applies `k`, `m` and `g` suffixes.
         let value = config.get_i64(key)?;
         if value >= 0 {
             return Ok(value as u64);
         }
-        panic!("`git config {}` cannot be negative value", key);
+        Err(git2::Error::from_str(&format!(
+            "`git config {}` cannot be negative value",
+            key
+        )))
     }
 }
 
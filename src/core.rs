@@ -12,7 +12,7 @@ use crate::args::DeleteFilter;
 use crate::branch::{
     LocalBranch, Refname, RemoteBranch, RemoteTrackingBranch, RemoteTrackingBranchStatus,
 };
-use crate::merge_tracker::MergeTracker;
+use crate::merge_tracker::{MergeState, MergeTracker};
 use crate::subprocess::{self, get_worktrees, RemoteHead};
 use crate::util::ForceSendSync;
 use crate::{config, BaseSpec, Git};
@@ -159,26 +159,27 @@ impl TrimPlan {
         repo: &Repository,
         preserved_patterns: &[&str],
     ) -> Result<()> {
+        let protected_refnames = get_protected_refnames(repo, preserved_patterns)?;
+        let protect_pattern = |refname: &str| protected_refnames.get(refname).copied();
+
         let mut preserve = Vec::new();
         for branch in &self.to_delete {
-            let pattern =
-                match &branch {
-                    ClassifiedBranch::MergedLocal(local)
-                    | ClassifiedBranch::Stray(local)
-                    | ClassifiedBranch::MergedDirectFetch { local, .. }
-                    | ClassifiedBranch::DivergedDirectFetch { local, .. }
-                    | ClassifiedBranch::MergedNonTrackingLocal(local) => {
-                        get_protect_pattern(&repo, preserved_patterns, local)?
-                    }
-                    ClassifiedBranch::MergedRemoteTracking(upstream)
-                    | ClassifiedBranch::MergedNonUpstreamRemoteTracking(upstream) => {
-                        get_protect_pattern(&repo, preserved_patterns, upstream)?
-                    }
-                    ClassifiedBranch::DivergedRemoteTracking { local, upstream } => {
-                        get_protect_pattern(&repo, preserved_patterns, local)?
-                            .or(get_protect_pattern(&repo, preserved_patterns, upstream)?)
-                    }
-                };
+            let pattern = match &branch {
+                ClassifiedBranch::MergedLocal(local)
+                | ClassifiedBranch::Stray(local)
+                | ClassifiedBranch::MergedDirectFetch { local, .. }
+                | ClassifiedBranch::DivergedDirectFetch { local, .. }
+                | ClassifiedBranch::MergedNonTrackingLocal(local) => {
+                    protect_pattern(local.refname())
+                }
+                ClassifiedBranch::MergedRemoteTracking(upstream)
+                | ClassifiedBranch::MergedNonUpstreamRemoteTracking(upstream) => {
+                    protect_pattern(upstream.refname())
+                }
+                ClassifiedBranch::DivergedRemoteTracking { local, upstream } => {
+                    protect_pattern(local.refname()).or_else(|| protect_pattern(upstream.refname()))
+                }
+            };
 
             if let Some(pattern) = pattern {
                 preserve.push(Preserved {
@@ -371,22 +372,44 @@ impl TrimPlan {
         Ok(())
     }
 
-    pub fn get_preserved_local(&self, target: &LocalBranch) -> Option<&Preserved> {
+    /// Index preserved branches to look up many of them.
+    pub fn preserved_index(&self) -> PreservedIndex<'_> {
+        let mut locals = HashMap::new();
+        let mut upstreams = HashMap::new();
         for preserved in &self.preserved {
-            if preserved.branch.local() == Some(target) {
-                return Some(preserved);
+            if let Some(local) = preserved.branch.local() {
+                locals.entry(local).or_insert(preserved);
+            }
+            if let Some(upstream) = preserved.branch.upstream() {
+                upstreams.entry(upstream).or_insert(preserved);
             }
         }
-        None
+        PreservedIndex { locals, upstreams }
+    }
+
+    pub fn get_preserved_local(&self, target: &LocalBranch) -> Option<&Preserved> {
+        self.preserved_index().local(target)
     }
 
     pub fn get_preserved_upstream(&self, target: &RemoteTrackingBranch) -> Option<&Preserved> {
-        for preserved in &self.preserved {
-            if preserved.branch.upstream() == Some(target) {
-                return Some(preserved);
-            }
-        }
-        None
+        self.preserved_index().upstream(target)
+    }
+}
+
+/// Preserved branches of a `TrimPlan` by their local and upstream branches.
+/// The first preserved entry of a branch wins.
+pub struct PreservedIndex<'a> {
+    locals: HashMap<&'a LocalBranch, &'a Preserved>,
+    upstreams: HashMap<&'a RemoteTrackingBranch, &'a Preserved>,
+}
+
+impl<'a> PreservedIndex<'a> {
+    pub fn local(&self, target: &LocalBranch) -> Option<&'a Preserved> {
+        self.locals.get(target).copied()
+    }
+
+    pub fn upstream(&self, target: &RemoteTrackingBranch) -> Option<&'a Preserved> {
+        self.upstreams.get(target).copied()
     }
 }
 
@@ -413,25 +436,26 @@ impl SkipSuggestion {
     }
 }
 
-fn get_protect_pattern<'a, B: Refname>(
+const PROTECT_PATTERN_PREFIXES: &[&str] = &["", "refs/remotes/", "refs/heads/"];
+
+/// Expand protected patterns into the refnames they match, mapped to the first matching pattern.
+fn get_protected_refnames<'a>(
     repo: &Repository,
     protected_patterns: &[&'a str],
-    branch: &B,
-) -> Result<Option<&'a str>> {
-    let prefixes = &["", "refs/remotes/", "refs/heads/"];
-    let target_refname = branch.refname();
+) -> Result<HashMap<String, &'a str>> {
+    let mut result = HashMap::new();
     for protected_pattern in protected_patterns {
-        for prefix in prefixes {
+        for prefix in PROTECT_PATTERN_PREFIXES {
             for reference in repo.references_glob(&format!("{}{}", prefix, protected_pattern))? {
                 let reference = reference?;
                 let refname = reference.name().context("non utf-8 refname")?;
-                if target_refname == refname {
-                    return Ok(Some(protected_pattern));
-                }
+                result
+                    .entry(refname.to_owned())
+                    .or_insert(*protected_pattern);
             }
         }
     }
-    Ok(None)
+    Ok(result)
 }
 
 #[derive(Hash, Eq, PartialEq, Debug, Clone)]
@@ -644,7 +668,22 @@ impl<'a> ClassificationRequest for TrackingBranchClassificationRequest<'a> {
     ) -> Result<ClassificationResponse> {
         let local = merge_tracker.check_and_track(&git.repo, &self.base.refname, self.local)?;
         let upstream = if let Some(upstream) = self.upstream {
-            merge_tracker.check_and_track(&git.repo, &self.base.refname, upstream)?
+            let upstream_commit = git
+                .repo
+                .find_reference(&upstream.refname)?
+                .peel_to_commit()?
+                .id()
+                .to_string();
+            if upstream_commit == local.commit {
+                // Up to date with the upstream. Don't check the same commit twice.
+                MergeState {
+                    branch: upstream.clone(),
+                    commit: upstream_commit,
+                    merged: local.merged,
+                }
+            } else {
+                merge_tracker.check_and_track(&git.repo, &self.base.refname, upstream)?
+            }
         } else {
             let result = if local.merged {
                 ClassificationResponse {
@@ -808,80 +847,64 @@ impl<'a> ClassificationRequest for NonUpstreamBranchClassificationRequest<'a> {
     }
 }
 
-pub fn get_tracking_branches(
-    git: &Git,
-) -> Result<Vec<(LocalBranch, Option<RemoteTrackingBranch>)>> {
-    let mut result = Vec::new();
-    for branch in git.repo.branches(Some(BranchType::Local))? {
-        let local = LocalBranch::try_from(&branch?.0)?;
-
-        match local.fetch_upstream(&git.repo, &git.config)? {
-            RemoteTrackingBranchStatus::Exists(upstream) => {
-                result.push((local, Some(upstream)));
-            }
-            RemoteTrackingBranchStatus::Gone(_) => result.push((local, None)),
-            _ => {
-                continue;
-            }
-        };
-    }
-
-    Ok(result)
+#[derive(Default)]
+pub struct LocalBranches {
+    pub tracking: Vec<(LocalBranch, Option<RemoteTrackingBranch>)>,
+    /// `hub-cli` style direct fetched branches
+    pub direct_fetch: Vec<(LocalBranch, RemoteBranch)>,
+    /// Local branches that doesn't track any branch.
+    pub non_tracking: Vec<LocalBranch>,
 }
 
-/// Get `hub-cli` style direct fetched branches
-pub fn get_direct_fetch_branches(git: &Git) -> Result<Vec<(LocalBranch, RemoteBranch)>> {
-    let mut result = Vec::new();
+/// Get local branches grouped by how they track their remote branches, in a single pass.
+pub fn get_local_branches(git: &Git) -> Result<LocalBranches> {
+    let mut result = LocalBranches::default();
     for branch in git.repo.branches(Some(BranchType::Local))? {
         let local = LocalBranch::try_from(&branch?.0)?;
 
         let remote = if let Some(remote) = config::get_remote_name(&git.config, &local)? {
             remote
         } else {
+            result.non_tracking.push(local);
             continue;
         };
 
-        if config::get_remote(&git.repo, &remote)?.is_some() {
-            continue;
-        }
+        if config::get_remote(&git.repo, &remote)?.is_none() {
+            let merge = config::get_merge(&git.config, &local)?.context(format!(
+                "Should have `branch.{}.merge` entry on git config",
+                local.short_name()
+            ))?;
 
-        let merge = config::get_merge(&git.config, &local)?.context(format!(
-            "Should have `branch.{}.merge` entry on git config",
-            local.short_name()
-        ))?;
-
-        let remote = RemoteBranch {
-            remote,
-            refname: merge,
-        };
-
-        result.push((local, remote));
-    }
-
-    Ok(result)
-}
-
-/// Get local branches that doesn't track any branch.
-pub fn get_non_tracking_local_branches(git: &Git) -> Result<Vec<LocalBranch>> {
-    let mut result = Vec::new();
-    for branch in git.repo.branches(Some(BranchType::Local))? {
-        let branch = LocalBranch::try_from(&branch?.0)?;
+            let remote = RemoteBranch {
+                remote,
+                refname: merge,
+            };
 
-        if config::get_remote_name(&git.config, &branch)?.is_some() {
+            result.direct_fetch.push((local, remote));
             continue;
         }
 
-        result.push(branch);
+        match local.fetch_upstream(&git.repo, &git.config)? {
+            RemoteTrackingBranchStatus::Exists(upstream) => {
+                result.tracking.push((local, Some(upstream)));
+            }
+            RemoteTrackingBranchStatus::Gone(_) => result.tracking.push((local, None)),
+            _ => {
+                continue;
+            }
+        };
     }
 
     Ok(result)
 }
 
 /// Get remote tracking branches that doesn't tracked by any branch.
-pub fn get_non_upstream_remote_tracking_branches(git: &Git) -> Result<Vec<RemoteTrackingBranch>> {
+pub fn get_non_upstream_remote_tracking_branches(
+    git: &Git,
+    tracking_branches: &[(LocalBranch, Option<RemoteTrackingBranch>)],
+) -> Result<Vec<RemoteTrackingBranch>> {
     let mut upstreams = HashSet::new();
 
-    let tracking_branches = get_tracking_branches(git)?;
     for (_local, upstream) in tracking_branches {
         if let Some(upstream) = upstream {
             upstreams.insert(upstream);
@@ -20,8 +20,7 @@ pub use crate::branch::{
     LocalBranch, Refname, RemoteBranch, RemoteBranchError, RemoteTrackingBranch,
 };
 use crate::core::{
-    get_direct_fetch_branches, get_non_tracking_local_branches,
-    get_non_upstream_remote_tracking_branches, get_remote_heads, get_tracking_branches, Classifier,
+    get_local_branches, get_non_upstream_remote_tracking_branches, get_remote_heads, Classifier,
     DirectFetchClassificationRequest, NonTrackingBranchClassificationRequest,
     NonUpstreamBranchClassificationRequest, TrackingBranchClassificationRequest,
 };
@@ -62,16 +61,18 @@ pub fn get_trim_plan(git: &Git, param: &PlanParam) -> Result<TrimPlan> {
         .collect();
     trace!("bases: {:#?}", bases);
 
-    let tracking_branches = get_tracking_branches(git)?;
+    let local_branches = get_local_branches(git)?;
+
+    let tracking_branches = local_branches.tracking;
     debug!("tracking_branches: {:#?}", tracking_branches);
 
-    let direct_fetch_branches = get_direct_fetch_branches(git)?;
+    let direct_fetch_branches = local_branches.direct_fetch;
     debug!("direct_fetch_branches: {:#?}", direct_fetch_branches);
 
-    let non_tracking_branches = get_non_tracking_local_branches(git)?;
+    let non_tracking_branches = local_branches.non_tracking;
     debug!("non_tracking_branches: {:#?}", non_tracking_branches);
 
-    let non_upstream_branches = get_non_upstream_remote_tracking_branches(git)?;
+    let non_upstream_branches = get_non_upstream_remote_tracking_branches(git, &tracking_branches)?;
     debug!("non_upstream_branches: {:#?}", non_upstream_branches);
 
     let remote_heads = if param.delete.scan_tracking() {
@@ -152,6 +152,8 @@ Then `git branch --set-upstream <remote>/<base branch> <base branch>` to set an
 }
 
 pub fn print_summary(plan: &TrimPlan, repo: &Repository) -> Result<()> {
+    let preserved_index = plan.preserved_index();
+
     println!("Branches that will remain:");
     println!("  local branches:");
     let local_branches_to_delete = HashSet::<_>::from_iter(plan.locals_to_delete());
@@ -163,7 +165,7 @@ pub fn print_summary(plan: &TrimPlan, repo: &Repository) -> Result<()> {
         if local_branches_to_delete.contains(&branch) {
             continue;
         }
-        if let Some(preserved) = plan.get_preserved_local(&branch) {
+        if let Some(preserved) = preserved_index.local(&branch) {
             if preserved.base && matches!(preserved.branch, ClassifiedBranch::MergedLocal(_)) {
                 println!("    {} [{}]", branch_name, preserved.reason);
             } else {
@@ -198,7 +200,7 @@ pub fn print_summary(plan: &TrimPlan, repo: &Repository) -> Result<()> {
         if remote_refs_to_delete.contains(&remote_branch) {
             continue;
         }
-        if let Some(preserved) = plan.get_preserved_upstream(&upstream) {
+        if let Some(preserved) = preserved_index.upstream(&upstream) {
             if preserved.base
                 && matches!(preserved.branch, ClassifiedBranch::MergedRemoteTracking(_))
             {
@@ -1,4 +1,4 @@
-use std::collections::HashSet;
+use std::collections::{HashMap, HashSet};
 use std::fmt::Debug;
 use std::sync::{Arc, Mutex};
 
@@ -11,7 +11,8 @@ use crate::subprocess::{self, is_merged_by_rev_list};
 
 #[derive(Clone)]
 pub struct MergeTracker {
-    merged_set: Arc<Mutex<HashSet<String>>>,
+    merged_set: Arc<Mutex<HashSet<Oid>>>,
+    base_commits: HashMap<String, Oid>,
 }
 
 #[derive(Debug, Clone)]
@@ -27,8 +28,19 @@ impl MergeTracker {
         config: &Config,
         base_upstreams: &[RemoteTrackingBranch],
     ) -> Result<Self> {
+        // Resolve the tips of bases once. They are looked up by every classification request.
+        let mut base_commits = HashMap::new();
+        for base_upstream in base_upstreams {
+            let base_commit_id = repo
+                .find_reference(&base_upstream.refname)?
+                .peel_to_commit()?
+                .id();
+            base_commits.insert(base_upstream.refname.clone(), base_commit_id);
+        }
+
         let tracker = Self {
             merged_set: Arc::new(Mutex::new(HashSet::new())),
+            base_commits,
         };
         info!("Initializing MergeTracker");
         for base_upstream in base_upstreams {
@@ -36,12 +48,14 @@ impl MergeTracker {
             tracker.track(repo, base_upstream)?;
         }
 
-        for merged_local in subprocess::get_noff_merged_locals(repo, config, base_upstreams)? {
+        let (merged_locals, merged_remotes) =
+            subprocess::get_noff_merged_branches(repo, config, base_upstreams)?;
+        for merged_local in merged_locals {
             debug!("merged_local: {:?}", merged_local);
             tracker.track(repo, &merged_local)?;
         }
 
-        for merged_remote in subprocess::get_noff_merged_remotes(&repo, base_upstreams)? {
+        for merged_remote in merged_remotes {
             debug!("merged_remote: {:?}", merged_remote);
             tracker.track(repo, &merged_remote)?;
         }
@@ -56,8 +70,7 @@ impl MergeTracker {
         let oid = repo
             .find_reference(branch.refname())?
             .peel_to_commit()?
-            .id()
-            .to_string();
+            .id();
         let mut set = self.merged_set.lock().unwrap();
         trace!("track: {}", oid);
         set.insert(oid);
@@ -73,7 +86,6 @@ impl MergeTracker {
     where
         T: Refname + Clone,
     {
-        let base_commit_id = repo.find_reference(base)?.peel_to_commit()?.id();
         let target_commit_id = repo
             .find_reference(branch.refname())?
             .peel_to_commit()?
@@ -83,22 +95,25 @@ impl MergeTracker {
         // I know the locking is ugly. I'm trying to hold the lock as short as possible.
         // Operations against `repo` take long time up to several seconds when the disk is slow.
         {
-            let set = self.merged_set.lock().unwrap().clone();
-            if set.contains(&target_commit_id_string) {
-                debug!(
-                    "tracked: {} ({})",
-                    &target_commit_id_string[0..7],
-                    branch.refname(),
-                );
-                return Ok(MergeState {
-                    merged: true,
-                    commit: target_commit_id_string,
-                    branch: branch.clone(),
-                });
-            }
+            // Copy out `Oid`s, which are plain bytes, instead of cloning the whole set.
+            let merged_commit_ids: Vec<Oid> = {
+                let set = self.merged_set.lock().unwrap();
+                if set.contains(&target_commit_id) {
+                    debug!(
+                        "tracked: {} ({})",
+                        &target_commit_id_string[0..7],
+                        branch.refname(),
+                    );
+                    return Ok(MergeState {
+                        merged: true,
+                        commit: target_commit_id_string,
+                        branch: branch.clone(),
+                    });
+                }
+                set.iter().copied().collect()
+            };
 
-            for merged in set.iter() {
-                let merged_oid = Oid::from_str(merged)?;
+            for merged_oid in merged_commit_ids {
                 //         B  A
                 //     *--*--*
                 //   /        \
@@ -106,22 +121,21 @@ impl MergeTracker {
                 // In this diagram, `$(git merge-base A B) == B`.
                 // When we're sure that A is merged into base, then we can safely conclude that
                 // B is also merged into base.
-                let noff_merged = match repo.merge_base(merged_oid, target_commit_id) {
-                    Ok(merge_base) if merge_base == target_commit_id => {
-                        let mut set = self.merged_set.lock().unwrap();
-                        set.insert(target_commit_id_string.clone());
-                        true
-                    }
-                    Ok(_) => continue,
-                    Err(err) if merge_base_not_found(&err) => false,
-                    Err(err) => return Err(err.into()),
-                };
-                debug!("noff merged: ({}) -> {}", branch.refname(), &merged[0..7]);
-                return Ok(MergeState {
-                    merged: noff_merged,
-                    commit: target_commit_id_string,
-                    branch: branch.clone(),
-                });
+                // `git merge-base --is-ancestor B A` answers it without computing the merge base.
+                if repo.graph_descendant_of(merged_oid, target_commit_id)? {
+                    let mut set = self.merged_set.lock().unwrap();
+                    set.insert(target_commit_id);
+                    debug!(
+                        "noff merged: ({}) -> {}",
+                        branch.refname(),
+                        &merged_oid.to_string()[0..7]
+                    );
+                    return Ok(MergeState {
+                        merged: true,
+                        commit: target_commit_id_string,
+                        branch: branch.clone(),
+                    });
+                }
             }
         }
 
@@ -129,9 +143,28 @@ impl MergeTracker {
             err.class() == ErrorClass::Merge && err.code() == ErrorCode::NotFound
         }
 
+        // Branches that share no history with the base, like orphan branches, are never merged
+        // even if their commits are patch-equivalent to the ones in the base.
+        let base_commit_id = match self.base_commits.get(base) {
+            Some(base_commit_id) => *base_commit_id,
+            None => repo.find_reference(base)?.peel_to_commit()?.id(),
+        };
+        let merge_base = match repo.merge_base(base_commit_id, target_commit_id) {
+            Ok(merge_base) => merge_base.to_string(),
+            Err(err) if merge_base_not_found(&err) => {
+                debug!("unrelated history: {} -> {}", branch.refname(), &base);
+                return Ok(MergeState {
+                    merged: false,
+                    commit: target_commit_id_string,
+                    branch: branch.clone(),
+                });
+            }
+            Err(err) => return Err(err.into()),
+        };
+
         if is_merged_by_rev_list(repo, base, branch.refname())? {
             let mut set = self.merged_set.lock().unwrap();
-            set.insert(target_commit_id_string.clone());
+            set.insert(target_commit_id);
             debug!("rebase merged: {} -> {}", branch.refname(), &base);
             return Ok(MergeState {
                 merged: true,
@@ -140,21 +173,10 @@ impl MergeTracker {
             });
         }
 
-        let squash_merged = match repo.merge_base(base_commit_id, target_commit_id) {
-            Ok(merge_base) => {
-                let merge_base = merge_base.to_string();
-                let squash_merged = is_squash_merged(repo, &merge_base, base, branch.refname())?;
-                if squash_merged {
-                    let mut set = self.merged_set.lock().unwrap();
-                    set.insert(target_commit_id_string.clone());
-                }
-                squash_merged
-            }
-            Err(err) if merge_base_not_found(&err) => false,
-            Err(err) => return Err(err.into()),
-        };
-
+        let squash_merged = is_squash_merged(repo, &merge_base, base, branch.refname())?;
         if squash_merged {
+            let mut set = self.merged_set.lock().unwrap();
+            set.insert(target_commit_id);
             debug!("squash merged: {} -> {}", branch.refname(), &base);
         }
         Ok(MergeState {
@@ -2,7 +2,6 @@ use std::iter::Iterator;
 
 use anyhow::{Context, Result};
 use git2::{Direction, Remote};
-use log::*;
 
 #[derive(Copy, Clone, Eq, PartialEq)]
 pub enum ExpansionSide {
@@ -34,8 +33,8 @@ pub fn expand_refspec(
 }
 
 fn expand(src: &str, dest: &str, reference: &str) -> Option<String> {
-    let src_stars = src.chars().filter(|&c| c == '*').count();
-    let dst_stars = dest.chars().filter(|&c| c == '*').count();
+    let src_stars = src.matches('*').count();
+    let dst_stars = dest.matches('*').count();
     assert!(
         src_stars <= 1 && src_stars == dst_stars,
         "Unsupported refspec patterns: {}:{}",
@@ -43,32 +42,49 @@ fn expand(src: &str, dest: &str, reference: &str) -> Option<String> {
         dest
     );
 
-    if let Some(matched) = simple_match(src, reference) {
-        Some(dest.replace("*", matched))
-    } else {
-        None
-    }
+    simple_match(src, reference).map(|matched| dest.replace('*', matched))
 }
 
+/// `pattern` has at most one asterisk. `expand` rejects the others.
 fn simple_match<'a>(pattern: &str, reference: &'a str) -> Option<&'a str> {
-    let src_stars = pattern.chars().filter(|&c| c == '*').count();
-    if src_stars <= 1 {
-        if let Some(star) = pattern.find('*') {
-            let left = &pattern[..star];
-            let right = &pattern[star + 1..];
-            if reference.starts_with(&left) && reference.ends_with(right) {
-                let matched = &reference[left.len()..reference.len() - right.len()];
-                return Some(matched);
-            }
-        } else if pattern == reference {
-            return Some("");
+    if let Some(star) = pattern.find('*') {
+        let left = &pattern[..star];
+        let right = &pattern[star + 1..];
+        // The prefix and the suffix must not overlap in `reference`.
+        if reference.len() >= left.len() + right.len()
+            && reference.starts_with(left)
+            && reference.ends_with(right)
+        {
+            return Some(&reference[left.len()..reference.len() - right.len()]);
         }
-        return None;
-    } else {
-        warn!(
-            "Unsupported refspec patterns, too many asterisks: {}",
-            pattern
-        );
+    } else if pattern == reference {
+        return Some("");
     }
     None
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_simple_match() {
+        assert_eq!(
+            simple_match("refs/heads/*", "refs/heads/feature"),
+            Some("feature")
+        );
+        assert_eq!(
+            simple_match("refs/heads/master", "refs/heads/master"),
+            Some("")
+        );
+        assert_eq!(
+            simple_match("refs/heads/master", "refs/heads/feature"),
+            None
+        );
+    }
+
+    #[test]
+    fn test_simple_match_overlapping_prefix_and_suffix() {
+        assert_eq!(simple_match("refs/heads/a*a", "refs/heads/a"), None);
+    }
+}
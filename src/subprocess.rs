@@ -4,17 +4,22 @@ use std::process::{Command, Stdio};
 use anyhow::{Context, Result};
 use git2::{Config, Reference, Repository};
 use log::*;
+use rayon::prelude::*;
 
 use crate::branch::{LocalBranch, RemoteBranch, RemoteTrackingBranch, RemoteTrackingBranchStatus};
+use crate::util::ForceSendSync;
 
-fn git(repo: &Repository, args: &[&str], level: log::Level) -> Result<()> {
+fn git_command(repo: &Repository, args: &[&str], level: log::Level) -> Result<Command> {
     let workdir = repo.workdir().context("Bare repository is not supported")?;
-    let workdir = workdir.to_str().context("non utf-8 workdir")?;
     log!(level, "> git {}", args.join(" "));
 
-    let mut cd_args = vec!["-C", workdir];
-    cd_args.extend_from_slice(args);
-    let exit_status = Command::new("git").args(cd_args).status()?;
+    let mut command = Command::new("git");
+    command.arg("-C").arg(workdir).args(args);
+    Ok(command)
+}
+
+fn git(repo: &Repository, args: &[&str], level: log::Level) -> Result<()> {
+    let exit_status = git_command(repo, args, level)?.status()?;
     if !exit_status.success() {
         Err(std::io::Error::from_raw_os_error(exit_status.code().unwrap_or(-1)).into())
     } else {
@@ -23,26 +28,39 @@ fn git(repo: &Repository, args: &[&str], level: log::Level) -> Result<()> {
 }
 
 fn git_output(repo: &Repository, args: &[&str], level: log::Level) -> Result<String> {
-    let workdir = repo.workdir().context("Bare repository is not supported")?;
-    let workdir = workdir.to_str().context("non utf-8 workdir")?;
-    log!(level, "> git {}", args.join(" "));
-
-    let mut cd_args = vec!["-C", workdir];
-    cd_args.extend_from_slice(args);
-    let output = Command::new("git")
-        .args(cd_args)
+    let output = git_command(repo, args, level)?
         .stdin(Stdio::null())
         .stdout(Stdio::piped())
         .output()?;
+    // `output()` captures stderr as well. Decode it only when git wrote something.
+    let stderr = if output.stderr.is_empty() {
+        None
+    } else {
+        Some(String::from_utf8_lossy(&output.stderr))
+    };
     if !output.status.success() {
-        return Err(std::io::Error::from_raw_os_error(output.status.code().unwrap_or(-1)).into());
+        let err = std::io::Error::from_raw_os_error(output.status.code().unwrap_or(-1));
+        return Err(match stderr {
+            Some(stderr) => anyhow::Error::new(err).context(stderr.trim().to_owned()),
+            None => err.into(),
+        });
+    }
+    if let Some(stderr) = stderr {
+        warn!("{}", stderr.trim());
     }
 
-    let str = std::str::from_utf8(&output.stdout)?.trim();
-    for line in str.lines() {
-        trace!("| {}", line);
+    // Trim in place to reuse the captured buffer rather than copying it.
+    let mut str = String::from_utf8(output.stdout)?;
+    let trimmed_len = str.trim_end().len();
+    str.truncate(trimmed_len);
+    let leading_whitespaces = str.len() - str.trim_start().len();
+    str.drain(..leading_whitespaces);
+    if log_enabled!(Level::Trace) {
+        for line in str.lines() {
+            trace!("| {}", line);
+        }
     }
-    Ok(str.to_string())
+    Ok(str)
 }
 
 pub fn remote_update(repo: &Repository, dry_run: bool) -> Result<()> {
@@ -76,31 +94,57 @@ pub fn is_merged_by_rev_list(repo: &Repository, base: &str, commit: &str) -> Res
     Ok(output.is_empty())
 }
 
-/// Get branches that are merged with merge commit.
-/// `git branch --format '%(refname)' --merged <base>`
-pub fn get_noff_merged_locals(
+/// Get local and remote tracking branches that are merged with merge commit.
+/// `git for-each-ref --format '%(refname)' --merged <base> refs/heads refs/remotes`
+pub fn get_noff_merged_branches(
     repo: &Repository,
     config: &Config,
     bases: &[RemoteTrackingBranch],
-) -> Result<HashSet<LocalBranch>> {
-    let mut result = HashSet::new();
-    for base in bases {
-        let refnames = git_output(
-            repo,
-            &[
-                "branch",
-                "--format",
-                "%(refname)",
-                "--merged",
-                &base.refname,
-            ],
-            Level::Trace,
-        )?;
-        for refname in refnames.lines() {
-            if !refnames.starts_with("refs/") {
-                // Detached HEAD is printed as '(HEAD detached at 1234abc)'
-                continue;
-            }
+) -> Result<(HashSet<LocalBranch>, HashSet<RemoteTrackingBranch>)> {
+    let merged_per_base = bases
+        .par_iter()
+        .map({
+            let repo = ForceSendSync::new(repo);
+            let config = ForceSendSync::new(config);
+            move |base| get_noff_merged_branches_of(&repo, &config, base)
+        })
+        .collect::<Result<Vec<_>>>()?;
+
+    let mut locals = HashSet::new();
+    let mut remotes = HashSet::new();
+    for (merged_locals, merged_remotes) in merged_per_base {
+        locals.extend(merged_locals);
+        remotes.extend(merged_remotes);
+    }
+    Ok((locals, remotes))
+}
+
+fn get_noff_merged_branches_of(
+    repo: &Repository,
+    config: &Config,
+    base: &RemoteTrackingBranch,
+) -> Result<(HashSet<LocalBranch>, HashSet<RemoteTrackingBranch>)> {
+    let mut locals = HashSet::new();
+    let mut remotes = HashSet::new();
+    let refnames = git_output(
+        repo,
+        &[
+            "for-each-ref",
+            "--format",
+            "%(refname)",
+            "--merged",
+            &base.refname,
+            "refs/heads",
+            "refs/remotes",
+        ],
+        Level::Trace,
+    )?;
+    for refname in refnames.lines() {
+        let reference = repo.find_reference(&refname)?;
+        if reference.symbolic_target().is_some() {
+            continue;
+        }
+        if refname.starts_with("refs/heads/") {
             let branch = LocalBranch::new(refname);
             let upstream = branch.fetch_upstream(repo, config)?;
             if let RemoteTrackingBranchStatus::Exists(upstream) = upstream {
@@ -108,49 +152,16 @@ pub fn get_noff_merged_locals(
                     continue;
                 }
             }
-            let reference = repo.find_reference(&refname)?;
-            if reference.symbolic_target().is_some() {
-                continue;
-            }
-            result.insert(branch);
-        }
-    }
-    Ok(result)
-}
-
-/// Get remote tracking branches that are merged with merge commit.
-/// `git branch --format '%(refname)' --remote --merged <base>`
-pub fn get_noff_merged_remotes(
-    repo: &Repository,
-    bases: &[RemoteTrackingBranch],
-) -> Result<HashSet<RemoteTrackingBranch>> {
-    let mut result = HashSet::new();
-    for base in bases {
-        let refnames = git_output(
-            repo,
-            &[
-                "branch",
-                "--format",
-                "%(refname)",
-                "--remote",
-                "--merged",
-                &base.refname,
-            ],
-            Level::Trace,
-        )?;
-        for refname in refnames.lines() {
+            locals.insert(branch);
+        } else {
             let branch = RemoteTrackingBranch::new(refname);
             if base == &branch {
                 continue;
             }
-            let reference = repo.find_reference(&refname)?;
-            if reference.symbolic_target().is_some() {
-                continue;
-            }
-            result.insert(branch);
+            remotes.insert(branch);
         }
     }
-    Ok(result)
+    Ok((locals, remotes))
 }
 
 #[derive(Debug)]
@@ -163,13 +174,13 @@ pub struct RemoteHead {
 pub fn ls_remote_heads(repo: &Repository, remote_name: &str) -> Result<Vec<RemoteHead>> {
     let mut result = Vec::new();
     for line in git_output(repo, &["ls-remote", "--heads", remote_name], Level::Trace)?.lines() {
-        let records = line.split_whitespace().collect::<Vec<_>>();
-        let commit = records[0].to_string();
-        let refname = records[1].to_string();
+        let mut records = line.split_whitespace();
+        let commit = records.next().context("no commit in ls-remote output")?;
+        let refname = records.next().context("no refname in ls-remote output")?;
         result.push(RemoteHead {
             remote: remote_name.to_owned(),
-            refname,
-            commit,
+            refname: refname.to_owned(),
+            commit: commit.to_owned(),
         });
     }
     Ok(result)
@@ -181,12 +192,9 @@ pub fn ls_remote_head(repo: &Repository, remote_name: &str) -> Result<RemoteHead
     let mut refname = None;
     let mut commit = None;
     for line in lines.lines() {
-        if line.starts_with("ref: ") {
-            refname = Some(
-                line["ref: ".len()..line.len() - "HEAD".len()]
-                    .trim()
-                    .to_owned(),
-            )
+        // ref: refs/heads/master	HEAD
+        if let Some(symref) = line.strip_prefix("ref: ") {
+            refname = symref.split_whitespace().next().map(|x| x.to_owned());
         } else {
             commit = line.split_whitespace().next().map(|x| x.to_owned());
         }
@@ -209,10 +217,10 @@ pub fn get_worktrees(repo: &Repository) -> Result<HashMap<LocalBranch, String>>
     let mut worktree = None;
     let mut branch = None;
     for line in git_output(repo, &["worktree", "list", "--porcelain"], Level::Trace)?.lines() {
-        if line.starts_with("worktree ") {
-            worktree = Some(line["worktree ".len()..].to_owned());
-        } else if line.starts_with("branch ") {
-            branch = Some(LocalBranch::new(&line["branch ".len()..]));
+        if let Some(path) = line.strip_prefix("worktree ") {
+            worktree = Some(path.to_owned());
+        } else if let Some(refname) = line.strip_prefix("branch ") {
+            branch = Some(LocalBranch::new(refname));
         } else if line.is_empty() {
             if let (Some(worktree), Some(branch)) = (worktree.take(), branch.take()) {
                 result.insert(branch, worktree);
@@ -182,3 +182,39 @@ fn test_delete_filter_multiple_comma_separated_values() -> Result<()> {
     );
     Ok(())
 }
+
+#[test]
+fn test_update_interval_suffixed_value() -> Result<()> {
+    let guard = fixture().prepare(
+        "local",
+        r#"
+        local <<EOF
+            git config trim.updateInterval 1k
+        EOF
+        "#,
+    )?;
+
+    let git = Git::try_from(Repository::open(guard.working_directory())?)?;
+    let config = Config::read(&git.repo, &git.config, &Args::default())?;
+
+    assert_eq!(config.update_interval, ConfigValue::GitConfig(1024));
+    Ok(())
+}
+
+#[test]
+fn test_update_interval_negative_value() -> Result<()> {
+    let guard = fixture().prepare(
+        "local",
+        r#"
+        local <<EOF
+            git config trim.updateInterval -1
+        EOF
+        "#,
+    )?;
+
+    let git = Git::try_from(Repository::open(guard.working_directory())?)?;
+    let config = Config::read(&git.repo, &git.config, &Args::default());
+
+    assert!(config.is_err());
+    Ok(())
+}
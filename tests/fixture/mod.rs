@@ -1,20 +1,43 @@
+use std::collections::HashMap;
+use std::ffi::OsStr;
 use std::fmt::Write;
-use std::io::{BufRead, BufReader, Error, Write as _};
+use std::fs;
+use std::io::{BufRead, BufReader, BufWriter, Error, ErrorKind, Write as _};
 use std::iter::FromIterator;
-use std::path::PathBuf;
+use std::path::{Path, PathBuf};
 use std::process::{Command, Stdio};
-use std::thread::spawn;
+use std::sync::{Arc, Mutex};
+use std::thread;
 
+use lazy_static::lazy_static;
 use log::*;
 use tempfile::{tempdir, TempDir};
 
 use git_trim::args::{DeleteFilter, DeleteRange, Scope};
 use git_trim::PlanParam;
 
+/// Log target of the fixture output.
+const OUTPUT_TARGET: &str = "stderr";
+/// Lists absolute paths of the directory where a template was built, canonical one first.
+const TEMPLATE_BUILD_PATHS: &str = ".build-paths";
+/// Fixtures are disposable. Don't spend time on durability, signing, gc and hook templates.
+const GIT_ENVS: &[(&str, &str)] = &[
+    ("GIT_CONFIG_COUNT", "3"),
+    ("GIT_CONFIG_KEY_0", "core.fsync"),
+    ("GIT_CONFIG_VALUE_0", "none"),
+    ("GIT_CONFIG_KEY_1", "commit.gpgSign"),
+    ("GIT_CONFIG_VALUE_1", "false"),
+    ("GIT_CONFIG_KEY_2", "gc.auto"),
+    ("GIT_CONFIG_VALUE_2", "0"),
+    ("GIT_TEMPLATE_DIR", ""),
+];
+
 #[derive(Default)]
 pub struct Fixture {
+    rc: String,
     fixture: String,
     epilogue: String,
+    logged_epilogue: String,
 }
 
 impl Fixture {
@@ -22,21 +45,32 @@ impl Fixture {
         Fixture::default()
     }
 
+    fn append_rc(&self, appended: &str) -> Fixture {
+        let mut rc = String::new();
+        writeln!(rc, "{}", self.rc).unwrap();
+        writeln!(rc, "echo ::set-level::none >&2").unwrap();
+        writeln!(rc, "{}", textwrap::dedent(appended)).unwrap();
+        Fixture {
+            rc,
+            fixture: self.fixture.clone(),
+            epilogue: self.epilogue.clone(),
+            logged_epilogue: self.logged_epilogue.clone(),
+        }
+    }
+
     fn append_fixture(&self, log_level: &str, appended: &str) -> Fixture {
         let mut fixture = String::new();
         writeln!(fixture, "{}", self.fixture).unwrap();
         writeln!(fixture, "echo ::set-level::{} >&2", log_level).unwrap();
         writeln!(fixture, "{}", textwrap::dedent(appended)).unwrap();
         Fixture {
+            rc: self.rc.clone(),
             fixture,
             epilogue: self.epilogue.clone(),
+            logged_epilogue: self.logged_epilogue.clone(),
         }
     }
 
-    pub fn append_fixture_none(&self, appended: &str) -> Fixture {
-        self.append_fixture("none", appended)
-    }
-
     pub fn append_fixture_trace(&self, appended: &str) -> Fixture {
         self.append_fixture("trace", appended)
     }
@@ -50,8 +84,23 @@ impl Fixture {
         writeln!(epilogue, "{}", self.epilogue).unwrap();
         writeln!(epilogue, "{}", textwrap::dedent(appended)).unwrap();
         Fixture {
+            rc: self.rc.clone(),
             fixture: self.fixture.clone(),
             epilogue,
+            logged_epilogue: self.logged_epilogue.clone(),
+        }
+    }
+
+    /// Appends to the epilogue, only when its output can be logged.
+    fn append_logged_epilogue(&self, appended: &str) -> Fixture {
+        let mut logged_epilogue = String::new();
+        writeln!(logged_epilogue, "{}", self.logged_epilogue).unwrap();
+        writeln!(logged_epilogue, "{}", textwrap::dedent(appended)).unwrap();
+        Fixture {
+            rc: self.rc.clone(),
+            fixture: self.fixture.clone(),
+            epilogue: self.epilogue.clone(),
+            logged_epilogue,
         }
     }
 
@@ -62,91 +111,301 @@ impl Fixture {
     ) -> std::io::Result<FixtureGuard> {
         let _ = env_logger::builder().is_test(true).try_init();
 
-        let tempdir = tempdir()?;
+        let tempdir = fixture_tempdir()?;
         println!("{:?}", tempdir.path());
-        let mut command = Command::new("bash");
-        command
-            .args(&["--noprofile", "--norc", "-xeo", "pipefail"])
-            .current_dir(tempdir.path())
-            .stdin(Stdio::piped())
-            .stdout(Stdio::piped())
-            .stderr(Stdio::piped());
+
+        // Both are already dedented by `append_*`.
+        let mut last_fixture = Fixture::new().append_fixture_debug(last_fixture).fixture;
+        writeln!(last_fixture, "{}", self.epilogue).unwrap();
+        // Its output is logged as plain lines, at info level.
+        if log_enabled!(target: OUTPUT_TARGET, Level::Info) {
+            writeln!(last_fixture, "{}", self.logged_epilogue).unwrap();
+        }
         if !cfg!(windows) {
-            command.env_clear();
+            let template = self.template()?;
+            copy_template(&template, tempdir.path())?;
+            run_bash(tempdir.path(), &[&self.rc, &last_fixture])?;
         } else {
-            // If I don't touch any env, Rust just calls `CreateProcessW` with "bash"
-            // However, Windows finds the binary from "C:\windows\system32" first [1]
-            // and "bash.exe" is there if WSL is installed to the System.
-            // However, when there is no WSL distro (ex: GitHub Actions), it just raise an error.
-            // When I touch any of env, Rust finds the binary from `%PATH%` [2]
-            // It is weird and unreliable hack, but I DONT WANT WSL BASH AND IT WORKS FOR NOW.
-            // [1] https://docs.microsoft.com/en-us/windows/win32/api/processthreadsapi/nf-processthreadsapi-createprocessw
-            // [2] https://github.com/rust-lang/rust/issues/37519
-            command.env("ASDF", "QWER");
+            // Git for Windows and bash write paths in different forms,
+            // so it is hard to relocate a template. Build everything from scratch.
+            run_bash(tempdir.path(), &[&self.rc, &self.fixture, &last_fixture])?;
         }
-        let mut bash = command.spawn()?;
-
-        let mut stdin = bash.stdin.take().unwrap();
-        let merged_fixture = self
-            .append_fixture_debug(&textwrap::dedent(last_fixture))
-            .append_fixture_debug(&self.epilogue);
-        writeln!(stdin, "{}", &merged_fixture.fixture).unwrap();
-        drop(stdin);
-
-        let stdout_thread = spawn({
-            let stdout = bash.stdout.take().unwrap();
-            move || {
-                for line in BufReader::new(stdout).lines() {
-                    match line {
-                        Ok(line) if line.starts_with('+') => trace!("{}", line),
-                        Ok(line) => info!("{}", line),
-                        Err(err) => error!("{}", err),
-                    }
+
+        Ok(FixtureGuard {
+            tempdir,
+            working_directory: working_directory.to_string(),
+        })
+    }
+
+    /// Build the shared part of fixtures once, and reuse it across the tests of this process.
+    fn template(&self) -> std::io::Result<PathBuf> {
+        // Hold the registry only to get the slot and the directory.
+        let (slot, dir) = {
+            let mut templates = TEMPLATES
+                .lock()
+                .unwrap_or_else(|poisoned| poisoned.into_inner());
+            let slot = templates
+                .slots
+                .entry((self.rc.clone(), self.fixture.clone()))
+                .or_default()
+                .clone();
+            let dir = match &templates.dir {
+                Some(dir) => dir.clone(),
+                None => {
+                    let dir = templates_dir()?;
+                    templates.dir = Some(dir.clone());
+                    dir
                 }
+            };
+            (slot, dir)
+        };
+
+        // Tests run in parallel threads and usually share the same template.
+        // Let the first one build it and the others wait for it.
+        // Tests that need other templates build theirs at the same time.
+        let mut template = slot.lock().unwrap_or_else(|poisoned| poisoned.into_inner());
+        if let Some(template) = &*template {
+            return Ok(template.clone());
+        }
+
+        let build = tempfile::Builder::new()
+            .prefix("template-")
+            .tempdir_in(&dir)?;
+        run_bash(build.path(), &[&self.rc, &self.fixture])?;
+
+        // Git writes absolute paths of remotes and worktrees. They are relocated on copy.
+        let mut build_paths = String::new();
+        writeln!(build_paths, "{}", fs::canonicalize(build.path())?.display()).unwrap();
+        writeln!(build_paths, "{}", build.path().display()).unwrap();
+        fs::write(build.path().join(TEMPLATE_BUILD_PATHS), build_paths)?;
+
+        let built = build.into_path();
+        *template = Some(built.clone());
+        Ok(built)
+    }
+}
+
+/// A template that is built once. Its lock is held while building.
+type TemplateSlot = Arc<Mutex<Option<PathBuf>>>;
+
+/// Templates of this process, keyed by their rc and fixture.
+#[derive(Default)]
+struct Templates {
+    dir: Option<PathBuf>,
+    slots: HashMap<(String, String), TemplateSlot>,
+}
+
+lazy_static! {
+    static ref TEMPLATES: Mutex<Templates> = Mutex::new(Templates::default());
+}
+
+/// Directory for the templates of this process.
+///
+/// Statics are never dropped, so a `TempDir` wouldn't be cleaned up at exit.
+/// Instead, each process builds templates in `<test binary>-<pid>`, and removes the
+/// directories of processes that have exited. Processes running the same test binary at the
+/// same time never touch each other's templates.
+fn templates_dir() -> std::io::Result<PathBuf> {
+    // target/debug/deps/<test binary> -> target/debug/fixture-templates
+    let current_exe = std::env::current_exe()?;
+    let (target, name) = current_exe
+        .parent()
+        .and_then(Path::parent)
+        .zip(current_exe.file_stem())
+        .ok_or_else(|| Error::new(ErrorKind::NotFound, "no directory for templates"))?;
+    let templates = target.join("fixture-templates");
+    if let Ok(entries) = fs::read_dir(&templates) {
+        for entry in entries.flatten() {
+            if is_stale_templates_dir(&entry.file_name()) {
+                // Another process may be removing it too.
+                let _ = fs::remove_dir_all(entry.path());
+            }
+        }
+    }
+
+    let dir = templates.join(format!("{}-{}", name.to_string_lossy(), std::process::id()));
+    fs::create_dir_all(&dir)?;
+    Ok(dir)
+}
+
+/// Whether the process that built templates in the directory has exited.
+/// When in doubt, the directory is considered in use.
+fn is_stale_templates_dir(name: &OsStr) -> bool {
+    let pid = name
+        .to_str()
+        .and_then(|name| name.rsplit('-').next())
+        .and_then(|pid| pid.parse::<u32>().ok());
+    let pid = match pid {
+        Some(pid) if pid != std::process::id() => pid.to_string(),
+        _ => return false,
+    };
+    // `kill -0` only checks whether the process exists.
+    let alive = Command::new("kill")
+        .args(&["-0", &pid])
+        .stdout(Stdio::null())
+        .stderr(Stdio::null())
+        .status()
+        .map_or(true, |status| status.success());
+    !alive
+}
+
+/// Fixtures are thrown away after each test, so prefer tmpfs to skip disk IO of git.
+fn fixture_tempdir() -> std::io::Result<TempDir> {
+    let shm = Path::new("/dev/shm");
+    if shm.is_dir() {
+        tempfile::Builder::new().prefix("git-trim-").tempdir_in(shm)
+    } else {
+        tempdir()
+    }
+}
+
+fn run_bash(working_directory: &Path, scripts: &[&str]) -> std::io::Result<()> {
+    // Traces are only logged at debug and trace levels.
+    let options = if log_enabled!(target: OUTPUT_TARGET, Level::Debug) {
+        "-xeo"
+    } else {
+        "-eo"
+    };
+    let mut command = Command::new("bash");
+    command
+        .args(&["--noprofile", "--norc", options, "pipefail"])
+        .current_dir(working_directory)
+        .stdin(Stdio::piped())
+        .stdout(Stdio::null());
+    if log_enabled!(target: OUTPUT_TARGET, Level::Info) {
+        command.stderr(Stdio::piped());
+    } else {
+        // Nothing would be logged. The exit status is enough to catch failures.
+        command.stderr(Stdio::null());
+    }
+    if !cfg!(windows) {
+        command.env_clear();
+    } else {
+        // If I don't touch any env, Rust just calls `CreateProcessW` with "bash"
+        // However, Windows finds the binary from "C:\windows\system32" first [1]
+        // and "bash.exe" is there if WSL is installed to the System.
+        // However, when there is no WSL distro (ex: GitHub Actions), it just raise an error.
+        // When I touch any of env, Rust finds the binary from `%PATH%` [2]
+        // It is weird and unreliable hack, but I DONT WANT WSL BASH AND IT WORKS FOR NOW.
+        // [1] https://docs.microsoft.com/en-us/windows/win32/api/processthreadsapi/nf-processthreadsapi-createprocessw
+        // [2] https://github.com/rust-lang/rust/issues/37519
+        command.env("ASDF", "QWER");
+    }
+    command.envs(GIT_ENVS.iter().copied());
+    let mut bash = command.spawn()?;
+
+    // Feed the scripts from another thread. Bash reads them as it runs, and it could block
+    // on a full stderr pipe while we are still writing to it.
+    let mut stdin = BufWriter::new(bash.stdin.take().unwrap());
+    let scripts: Vec<String> = scripts.iter().map(|script| script.to_string()).collect();
+    let writer = thread::spawn(move || -> std::io::Result<()> {
+        // Send stdout to stderr so a single reader sees both in order.
+        writeln!(stdin, "exec 1>&2")?;
+        for script in &scripts {
+            writeln!(stdin, "{}", script)?;
+        }
+        // `BufWriter` ignores errors on drop.
+        stdin.flush()
+    });
+
+    let stderr = bash.stderr.take();
+    let mut level = Some(Level::Debug);
+    for line in stderr.into_iter().flat_map(|s| BufReader::new(s).lines()) {
+        match line {
+            Ok(line) if line.starts_with('+') && level.is_none() => {}
+            Ok(line) if line.starts_with('+') => {
+                log!(target: OUTPUT_TARGET, level.unwrap(), "{}", line)
             }
-        });
-
-        let stderr_thread = spawn({
-            let stderr = bash.stderr.take().unwrap();
-            move || {
-                let mut level = Some(Level::Debug);
-                for line in BufReader::new(stderr).lines() {
-                    match line {
-                        Ok(line) if line.starts_with('+') && level.is_none() => {}
-                        Ok(line) if line.starts_with('+') => {
-                            log!(target: "stderr", level.unwrap(), "{}", line)
-                        }
-                        Ok(line) if line.starts_with("::set-level::") => {
-                            if line.starts_with("::set-level::none") {
-                                level = None
-                            } else if line.starts_with("::set-level::trace") {
-                                level = Some(Level::Trace)
-                            } else if line.starts_with("::set-level::debug") {
-                                level = Some(Level::Debug)
-                            }
-                            if let Some(level) = level {
-                                log!(target: "stderr-set-level", level, "{}", line);
-                            }
-                        }
-                        Ok(line) => info!(target: "stderr", "stderr: {}", line),
-                        Err(err) => error!(target: "stderr", "stderr: {}", err),
-                    }
+            Ok(line) if line.starts_with("::set-level::") => {
+                if line.starts_with("::set-level::none") {
+                    level = None
+                } else if line.starts_with("::set-level::trace") {
+                    level = Some(Level::Trace)
+                } else if line.starts_with("::set-level::debug") {
+                    level = Some(Level::Debug)
+                }
+                if let Some(level) = level {
+                    log!(target: "stderr-set-level", level, "{}", line);
                 }
             }
-        });
-        stdout_thread.join().unwrap();
-        stderr_thread.join().unwrap();
+            Ok(line) => info!(target: OUTPUT_TARGET, "{}", line),
+            Err(err) => error!(target: OUTPUT_TARGET, "{}", err),
+        }
+    }
 
-        let exit_status = bash.wait()?;
-        if !exit_status.success() {
-            return Err(Error::from_raw_os_error(exit_status.code().unwrap_or(-1)));
+    let written = writer.join().unwrap();
+    let exit_status = bash.wait()?;
+    if !exit_status.success() {
+        return Err(Error::from_raw_os_error(exit_status.code().unwrap_or(-1)));
+    }
+    written
+}
+
+fn copy_template(template: &Path, dest: &Path) -> std::io::Result<()> {
+    let build_paths = fs::read_to_string(template.join(TEMPLATE_BUILD_PATHS))?;
+    let dest_path = dest.display().to_string();
+    let relocations: Vec<_> = build_paths
+        .lines()
+        .map(|build_path| (build_path.as_bytes(), dest_path.as_bytes()))
+        .collect();
+    copy_dir(template, dest, &relocations)
+}
+
+fn copy_dir(src: &Path, dest: &Path, relocations: &[(&[u8], &[u8])]) -> std::io::Result<()> {
+    for entry in fs::read_dir(src)? {
+        let entry = entry?;
+        if entry.file_name() == TEMPLATE_BUILD_PATHS {
+            continue;
+        }
+        let src = entry.path();
+        let dest = dest.join(entry.file_name());
+        if entry.file_type()?.is_dir() {
+            if entry.file_name() == "objects" && src.with_file_name("HEAD").is_file() {
+                // Objects are immutable. Borrow them from the template like `git clone --shared`.
+                fs::create_dir_all(dest.join("info"))?;
+                fs::write(
+                    dest.join("info").join("alternates"),
+                    format!("{}\n", src.display()),
+                )?;
+                continue;
+            }
+            fs::create_dir(&dest)?;
+            copy_dir(&src, &dest, relocations)?;
+            continue;
         }
 
-        Ok(FixtureGuard {
-            tempdir,
-            working_directory: working_directory.to_string(),
-        })
+        let content = fs::read(&src)?;
+        let mut relocated = None;
+        for (from, to) in relocations {
+            let current = relocated.as_ref().unwrap_or(&content);
+            if let Some(replaced) = replace_bytes(current, from, to) {
+                relocated = Some(replaced);
+            }
+        }
+        if let Some(relocated) = relocated {
+            fs::write(&dest, relocated)?;
+        } else {
+            fs::copy(&src, &dest)?;
+        }
+    }
+    Ok(())
+}
+
+fn replace_bytes(haystack: &[u8], from: &[u8], to: &[u8]) -> Option<Vec<u8>> {
+    let mut result = Vec::new();
+    let mut rest = haystack;
+    let mut replaced = false;
+    while let Some(pos) = rest.windows(from.len()).position(|window| window == from) {
+        result.extend_from_slice(&rest[..pos]);
+        result.extend_from_slice(to);
+        rest = &rest[pos + from.len()..];
+        replaced = true;
+    }
+    if !replaced {
+        return None;
     }
+    result.extend_from_slice(rest);
+    Some(result)
 }
 
 #[must_use]
@@ -163,7 +422,7 @@ impl FixtureGuard {
 
 pub fn rc() -> Fixture {
     Fixture::new()
-        .append_fixture_none(
+        .append_rc(
             r#"
             shopt -s expand_aliases
             within() {
@@ -174,13 +433,26 @@ pub fn rc() -> Fixture {
             alias upstream='within upstream'
             alias origin='within origin'
             alias local='within local'
+            # Fixtures only need empty files. Create them without spawning `/usr/bin/touch`.
+            touch() {
+                typeset file
+                for file in "$@"; do
+                    : >> "$file"
+                done
+            }
             "#,
         )
         .append_epilogue(
             r#"
             local <<EOF
-                pwd
                 git remote update --prune
+            EOF
+            "#,
+        )
+        .append_logged_epilogue(
+            r#"
+            local <<EOF
+                pwd
                 git branch -vv --all
                 git log --oneline --oneline --decorate --graph --all
             EOF
@@ -188,6 +460,64 @@ pub fn rc() -> Fixture {
         )
 }
 
+/// `origin` with an initial commit, and `local` cloned from it.
+#[allow(unused)]
+pub fn origin_and_local() -> Fixture {
+    rc().append_fixture_trace(
+        r#"
+        git init origin
+        origin <<EOF
+            git config user.name "Origin Test"
+            git config user.email "origin@test"
+            echo "Hello World!" > README.md
+            git add README.md
+            git commit -m "Initial commit"
+        EOF
+        git clone origin local
+        local <<EOF
+            git config user.name "Local Test"
+            git config user.email "local@test"
+            git config remote.pushdefault origin
+            git config push.default simple
+        EOF
+        "#,
+    )
+}
+
+/// `upstream` with an initial commit, `origin` cloned from it, and `local` cloned from `origin`
+/// that tracks `upstream/master`.
+#[allow(unused)]
+pub fn upstream_origin_and_local() -> Fixture {
+    rc().append_fixture_trace(
+        r#"
+        git init upstream
+        upstream <<EOF
+            git config user.name "UpstreamTest"
+            git config user.email "upstream@test"
+            echo "Hello World!" > README.md
+            git add README.md
+            git commit -m "Initial commit"
+        EOF
+        git clone upstream origin -o upstream
+        origin <<EOF
+            git config user.name "Origin Test"
+            git config user.email "origin@test"
+            git config remote.pushdefault upstream
+        EOF
+        git clone origin local
+        local <<EOF
+            git config user.name "Local Test"
+            git config user.email "local@test"
+            git config remote.pushdefault origin
+            git config push.default simple
+            git remote add upstream ../upstream
+            git fetch upstream
+            git branch -u upstream/master master
+        EOF
+        "#,
+    )
+}
+
 #[macro_export]
 macro_rules! set {
     {$($x:expr),*} => ({
@@ -7,35 +7,11 @@ use git2::Repository;
 
 use git_trim::{get_trim_plan, ClassifiedBranch, Git, LocalBranch, RemoteBranch};
 
-use fixture::{rc, test_default_param, Fixture};
+use fixture::{test_default_param, upstream_origin_and_local, Fixture};
 
 fn fixture() -> Fixture {
-    rc().append_fixture_trace(
+    upstream_origin_and_local().append_fixture_trace(
         r#"
-        git init upstream
-        upstream <<EOF
-            git config user.name "UpstreamTest"
-            git config user.email "upstream@test"
-            echo "Hello World!" > README.md
-            git add README.md
-            git commit -m "Initial commit"
-        EOF
-        git clone upstream origin -o upstream
-        origin <<EOF
-            git config user.name "Origin Test"
-            git config user.email "origin@test"
-            git config remote.pushdefault upstream
-        EOF
-        git clone origin local
-        local <<EOF
-            git config user.name "Local Test"
-            git config user.email "local@test"
-            git config remote.pushdefault origin
-            git config push.default simple
-            git remote add upstream ../upstream
-            git fetch upstream
-            git branch -u upstream/master master
-        EOF
         origin <<EOF
             git checkout -b feature
             touch awesome-patch
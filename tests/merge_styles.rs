@@ -7,26 +7,11 @@ use git2::Repository;
 
 use git_trim::{get_trim_plan, ClassifiedBranch, Git, LocalBranch};
 
-use fixture::{rc, test_default_param, Fixture};
+use fixture::{origin_and_local, test_default_param, Fixture};
 
 fn fixture() -> Fixture {
-    rc().append_fixture_trace(
+    origin_and_local().append_fixture_trace(
         r#"
-        git init origin
-        origin <<EOF
-            git config user.name "Origin Test"
-            git config user.email "origin@test"
-            echo "Hello World!" > README.md
-            git add README.md
-            git commit -m "Initial commit"
-        EOF
-        git clone origin local
-        local <<EOF
-            git config user.name "Local Test"
-            git config user.email "local@test"
-            git config remote.pushdefault origin
-            git config push.default simple
-        EOF
         # prepare awesome patch
         local <<EOF
             git checkout -b feature
@@ -118,23 +103,8 @@ fn test_squash() -> Result<()> {
 
 #[test]
 fn test_mixed() -> Result<()> {
-    let fixture = rc().append_fixture_trace(
+    let fixture = origin_and_local().append_fixture_trace(
         r#"
-        git init origin
-        origin <<EOF
-            git config user.name "Origin Test"
-            git config user.email "origin@test"
-            echo "Hello World!" > README.md
-            git add README.md
-            git commit -m "Initial commit"
-        EOF
-        git clone origin local
-        local <<EOF
-            git config user.name "Local Test"
-            git config user.email "local@test"
-            git config remote.pushdefault origin
-            git config push.default simple
-        EOF
         # prepare awesome patch
         mk_test_branches() {
             BASE=$1
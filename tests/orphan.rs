@@ -68,3 +68,38 @@ fn test_bases_implicit_value() -> Result<()> {
 
     Ok(())
 }
+
+#[test]
+fn test_patch_equivalent_orphan() -> Result<()> {
+    let guard = fixture().prepare(
+        "local",
+        r#"
+        local <<EOF
+            # The index still has README.md, so it has the same patch as the initial commit.
+            git checkout --orphan patch-equivalent
+            git commit -m "Initial commit, again"
+            git push -u origin patch-equivalent
+        EOF
+    "#,
+    )?;
+
+    let git = Git::try_from(Repository::open(guard.working_directory())?)?;
+    let plan = get_trim_plan(
+        &git,
+        &PlanParam {
+            delete: DeleteFilter::from_iter(vec![
+                DeleteRange::MergedLocal,
+                DeleteRange::MergedRemote(Scope::All),
+                DeleteRange::Stray,
+                DeleteRange::Diverged(Scope::All),
+                DeleteRange::Local,
+                DeleteRange::Remote(Scope::All),
+            ]),
+            ..test_default_param()
+        },
+    )?;
+
+    assert_eq!(plan.to_delete, set! {});
+
+    Ok(())
+}